@@ -1,7 +1,21 @@
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 from django_filters.filterset import FilterSet
 from django_filters.filters import CharFilter
-from food.models import Ingredient, Recipe, Tag
+from food.models import Favorite, Ingredient, Recipe, ShoppingCartItem, Tag
+
+TAG_CHOICES_CACHE_KEY = 'recipe_filter_tag_choices'
+
+
+def load_tag_choices():
+    return [
+        (slug, slug) for slug in Tag.objects.values_list('slug', flat=True)
+    ]
+
+
+def get_tag_choices():
+    return cache.get_or_set(TAG_CHOICES_CACHE_KEY, load_tag_choices)
 
 
 class IngredientFilter(FilterSet):
@@ -17,25 +31,34 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
-    tags = filters.ModelMultipleChoiceFilter(
+    tags = filters.MultipleChoiceFilter(
         field_name='tags__slug',
         label='tags',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+        choices=get_tag_choices,
     )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Кэш у каждого процесса свой, и сигнал сбрасывает его только
+        # в том, где сохранили тег: незнакомые слаги сверяем с базой.
+        slugs = set(self.data.getlist('tags')) if self.data else set()
+        if slugs and slugs - {slug for slug, _ in get_tag_choices()}:
+            cache.set(TAG_CHOICES_CACHE_KEY, load_tag_choices())
+
     def filter_is_favorited(self, recipes, name, value):
         user = self.request.user
-        if value and not user.is_anonymous:
-            return recipes.filter(favorites__user=user)
+        if value and user.is_authenticated:
+            return recipes.filter(Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return recipes
 
     def filter_is_in_shopping_cart(self, recipes, name, value):
         user = self.request.user
-        if value and not user.is_anonymous:
-            return recipes.filter(shoppingcartitems__user=user)
+        if value and user.is_authenticated:
+            return recipes.filter(Exists(ShoppingCartItem.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return recipes
@@ -1,7 +1,107 @@
+from math import ceil
+
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from rest_framework.pagination import PageNumberPagination
 
+# На небольших таблицах точный COUNT(*) дёшев и номера страниц точны.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class EstimatedCountPaginator(Paginator):
+    # Номер последней страницы, известный по данным выбранной страницы.
+    known_num_pages = None
+
+    @cached_property
+    def estimated_count(self):
+        query = getattr(self.object_list, 'query', None)
+        if (
+            query is None
+            or query.where
+            or query.distinct
+            or query.is_sliced
+        ):
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        # Оценка планировщика обновляется только при ANALYZE и может
+        # расходиться с реальным числом строк, поэтому она идёт лишь
+        # в поле count ответа.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+            return row[0]
+        return None
+
+    @cached_property
+    def count(self):
+        if self.estimated_count is not None:
+            return self.estimated_count
+        return super().count
+
+    @property
+    def num_pages(self):
+        if self.estimated_count is None:
+            return super().num_pages
+        if self.known_num_pages is not None:
+            return self.known_num_pages
+        # До выборки страницы (например, для page=last) число страниц
+        # считается по точному COUNT(*), а не по оценке.
+        return max(1, ceil(self.object_list.count() / self.per_page))
+
+    def validate_number(self, number):
+        if self.estimated_count is None:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if self.estimated_count is None:
+            return super().page(number)
+        # Границы страницы определяются данными: лишняя строка
+        # показывает, есть ли следующая страница.
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        has_next = len(objects) > self.per_page
+        self.known_num_pages = number + 1 if has_next else number
+        return EstimatedPage(
+            objects[:self.per_page], number, self, has_next=has_next
+        )
+
 
 class RecipePagination(PageNumberPagination):
+    django_paginator_class = EstimatedCountPaginator
     page_size = 6
     max_page_size = 100
     page_size_query_param = 'limit'
@@ -1,11 +1,17 @@
 from rest_framework import permissions
 from rest_framework.permissions import SAFE_METHODS
 
+SAFE_METHODS_SET = frozenset(SAFE_METHODS)
+
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        if request.method in SAFE_METHODS:
+        if request.method in SAFE_METHODS_SET:
             return True
         user = request.user
-        return obj.author == user or user.is_staff or user.is_superuser
+        return (
+            obj.author_id == user.id
+            or user.is_staff
+            or user.is_superuser
+        )
@@ -1,24 +1,62 @@
-from collections import Counter
+import copy
+from contextlib import contextmanager
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 
 from food.models import (
-    Favorite,
-    Follow,
     Ingredient,
     Recipe,
     RecipeIngredient,
-    ShoppingCartItem,
     Tag,
 )
 from library.base64ImageField import Base64ImageField
 
 User = get_user_model()
 
+INGREDIENT_IDS_CACHE_KEY = 'recipe_ingredient_ids'
 
-class FoodgramUserSerializer(DjoserUserSerializer):
+
+def get_ingredient_ids():
+    return cache.get_or_set(
+        INGREDIENT_IDS_CACHE_KEY,
+        lambda: set(Ingredient.objects.values_list('id', flat=True)),
+    )
+
+
+NESTED_FIELD_TYPES = (
+    serializers.BaseSerializer,
+    serializers.ManyRelatedField,
+    serializers.ListField,
+    serializers.DictField,
+)
+
+
+class CachedFieldsMixin:
+    # Поля строятся один раз на класс сериализатора; экземпляру достаются
+    # копии. Поля с дочерними полями (вложенные сериализаторы, many=True
+    # у связей, списки и словари) копируются глубоко, чтобы дочерние поля
+    # привязывались к новому родителю, а не делились между экземплярами.
+    _fields_cache = {}
+
+    def get_fields(self):
+        fields = self._fields_cache.get(type(self))
+        if fields is None:
+            fields = self._fields_cache[type(self)] = super().get_fields()
+        return {
+            name: (
+                copy.deepcopy(field)
+                if isinstance(field, NESTED_FIELD_TYPES)
+                else copy.copy(field)
+            )
+            for name, field in fields.items()
+        }
+
+
+class FoodgramUserSerializer(CachedFieldsMixin, DjoserUserSerializer):
     avatar = Base64ImageField(required=False, allow_null=True)
     is_subscribed = serializers.SerializerMethodField()
 
@@ -28,27 +66,32 @@ class FoodgramUserSerializer(DjoserUserSerializer):
         read_only_fields = fields
 
     def get_is_subscribed(self, author):
-        request = self.context.get('request')
-        return (
-            request
-            and not request.user.is_anonymous
-            and author.author_followes.filter(follower=request.user).exists()
-        )
+        if 'followed_ids' not in self.context:
+            request = self.context.get('request')
+            self.context['followed_ids'] = (
+                set(request.user.follower_followes.values_list(
+                    'author_id', flat=True))
+                if request and request.user.is_authenticated
+                else set()
+            )
+        return author.id in self.context['followed_ids']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
-class RecipeIngredientReadSerializer(serializers.ModelSerializer):
+class RecipeIngredientReadSerializer(
+    CachedFieldsMixin, serializers.ModelSerializer
+):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -61,27 +104,27 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient',
-    )
+class RecipeIngredientWriteSerializer(
+    CachedFieldsMixin, serializers.ModelSerializer
+):
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     ingredients = RecipeIngredientReadSerializer(
         source='ingredients_in_recipe',
         many=True,
     )
     author = FoodgramUserSerializer()
+    image = Base64ImageField(read_only=True)
 
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -99,23 +142,34 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
         read_only_fields = fields
 
-    def check_user_status(self, recipe, model_class):
-        request = self.context.get('request')
-        return (
-            request
-            and not request.user.is_anonymous
-            and model_class.objects.filter(
-                user=request.user, recipe=recipe).exists()
-        )
-
-    def get_is_favorited(self, recipe):
-        return self.check_user_status(recipe, Favorite)
-
-    def get_is_in_shopping_cart(self, recipe):
-        return self.check_user_status(recipe, ShoppingCartItem)
+    def to_representation(self, recipe):
+        fields = self.fields
+        return {
+            'id': recipe.id,
+            'tags': [
+                {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'author': fields['author'].to_representation(recipe.author),
+            'ingredients': [
+                {
+                    'id': item.ingredient.id,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.ingredients_in_recipe.all()
+            ],
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            'name': recipe.name,
+            'image': fields['image'].to_representation(recipe.image),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
+class RecipeWriteSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     ingredients = RecipeIngredientWriteSerializer(
         many=True,
         required=True,
@@ -127,7 +181,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         required=True,
         label='Теги',
     )
-    image = Base64ImageField()
+    image = Base64ImageField(write_only=True)
 
     class Meta:
         model = Recipe
@@ -148,22 +202,81 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     def create_ingredients(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create(
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient_id=item['ingredient'].id,
-                amount=item['amount'],
+            [
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=item['id'],
+                    amount=item['amount'],
+                )
+                for item in ingredients
+            ],
+            batch_size=500,
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        # Строки, уже загруженные вместе с рецептом, в порядке создания.
+        existing = {
+            item.ingredient_id: item
+            for item in sorted(
+                recipe.ingredients_in_recipe.all(), key=lambda item: item.pk
             )
-            for item in ingredients
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        requested_ids = list(amounts)
+        kept_ids = [
+            ingredient_id for ingredient_id in existing
+            if ingredient_id in amounts
+        ]
+        # Ингредиенты выводятся в порядке создания строк: если клиент
+        # переставил сохранённые или вставил новые перед ними, правка
+        # на месте этот порядок не передаст, и строки пересоздаются.
+        if requested_ids[:len(kept_ids)] != kept_ids:
+            RecipeIngredient.objects.filter(recipe=recipe).delete()
+            self.create_ingredients(ingredients, recipe)
+            return
+
+        removed_ids = existing.keys() - amounts.keys()
+        if removed_ids:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed_ids
+            ).delete()
+
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+
+        self.create_ingredients(
+            [item for item in ingredients if item['id'] not in existing],
+            recipe,
         )
 
+    @contextmanager
+    def saving_ingredients(self):
+        # Кеш id продуктов может помнить продукт, уже удалённый в другом
+        # процессе: тогда вставку отклонит внешний ключ. Откатываем
+        # рецепт целиком и сбрасываем кеш.
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            cache.delete(INGREDIENT_IDS_CACHE_KEY)
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиенты не найдены.'}
+            )
+
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        recipe = super().create(validated_data)
+        with self.saving_ingredients():
+            recipe = super().create(validated_data)
 
-        recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+            recipe.tags.set(tags)
+            self.create_ingredients(ingredients, recipe)
 
         return recipe
 
@@ -172,20 +285,31 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Необходимо указать хотя бы один ингредиент.'
             )
-        duplicate_ids = {
-            id_
-            for id_, count in Counter(
-                item['ingredient'].id for item in ingredients
-            ).items()
-            if count > 1
-        }
+        seen_ids = set()
+        seen_add = seen_ids.add
+        duplicate_ids = set()
+        for item in ingredients:
+            ingredient_id = item['id']
+            if ingredient_id in seen_ids:
+                duplicate_ids.add(ingredient_id)
+            else:
+                seen_add(ingredient_id)
+
+        missing_ids = seen_ids - get_ingredient_ids()
+        if missing_ids:
+            # Кеш мог не успеть увидеть новые продукты.
+            missing_ids -= set(Ingredient.objects.filter(
+                id__in=missing_ids).values_list('id', flat=True))
+        if missing_ids:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing_ids)}.'
+            )
         if not duplicate_ids:
             return ingredients
 
         names = Ingredient.objects.filter(id__in=duplicate_ids).values_list(
             'name', flat=True
         )
-
         raise serializers.ValidationError(
             f'Ингредиенты не должны повторяться: {list(names)}.'
         )
@@ -195,19 +319,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Нужно выбрать хотя бы один тег.')
 
-        duplicate_ids = {
-            id_
-            for id_, count in Counter(getattr(tag, 'id')
-                                      for tag in tags).items()
-            if count > 1
-        }
-        if not duplicate_ids:
+        seen_ids = set()
+        seen_add = seen_ids.add
+        duplicate_names = {}
+        for tag in tags:
+            if tag.id in seen_ids:
+                duplicate_names[tag.id] = tag.name
+            else:
+                seen_add(tag.id)
+        if not duplicate_names:
             return tags
 
-        names = Tag.objects.filter(
-            id__in=duplicate_ids).values_list('name', flat=True)
         raise serializers.ValidationError(
-            f'Теги не должны повторяться: {list(names)}.'
+            f'Теги не должны повторяться: {list(duplicate_names.values())}.'
         )
 
     def validate(self, data):
@@ -226,17 +350,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags', None)
 
-        if tags_data is not None:
-            instance.tags.set(tags_data)
+        with self.saving_ingredients():
+            if tags_data is not None:
+                instance.tags.set(tags_data)
 
-        if ingredients_data is not None:
-            instance.ingredients_in_recipe.all().delete()
-            self.create_ingredients(ingredients_data, instance)
+            if ingredients_data is not None:
+                self.update_ingredients(ingredients_data, instance)
 
-        return super().update(instance, validated_data)
+            return super().update(instance, validated_data)
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    image = Base64ImageField(read_only=True)
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -244,38 +370,14 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
 
 
 class FollowedUserSerializer(FoodgramUserSerializer):
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
+    recipes = ShortRecipeSerializer(
+        source='limited_recipes',
+        many=True,
         read_only=True,
     )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(FoodgramUserSerializer.Meta):
         fields = (*FoodgramUserSerializer.Meta.fields,
                   'recipes', 'recipes_count')
         read_only_fields = fields
-
-    def get_recipes(self, obj):
-        return ShortRecipeSerializer(
-            obj.recipes.all()[
-                : int(self.context['request'].GET.get('recipes_limit', 10**10))
-            ],
-            many=True,
-            context=self.context,
-        ).data
-
-
-class FollowCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Follow
-        fields = ('follower', 'author')
-
-    def validate(self, attrs):
-        follower = attrs['follower']
-        author = attrs['author']
-        if follower == author:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя')
-        if Follow.objects.filter(follower=follower, author=author).exists():
-            raise serializers.ValidationError('Подписка уже существует')
-        return attrs
@@ -0,0 +1,17 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.filters import TAG_CHOICES_CACHE_KEY
+from api.serializers import INGREDIENT_IDS_CACHE_KEY
+from food.models import Ingredient, Tag
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def reset_tag_choices_cache(**kwargs):
+    cache.delete(TAG_CHOICES_CACHE_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def reset_ingredient_ids_cache(**kwargs):
+    cache.delete(INGREDIENT_IDS_CACHE_KEY)
@@ -1,10 +1,8 @@
-import os
-
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.db import IntegrityError, models, transaction
+from django.http import StreamingHttpResponse
 from django.urls import reverse
+from django.utils.formats import date_format
 from django.utils.timezone import now
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
@@ -20,7 +18,6 @@ from api.filters import RecipeFilter, IngredientFilter
 from api.pagination import RecipePagination
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (
-    FollowCreateSerializer,
     FollowedUserSerializer,
     FoodgramUserSerializer,
     IngredientSerializer,
@@ -36,6 +33,38 @@ from food.models import (
 
 User = get_user_model()
 
+COLLECTION_NAMES = {
+    model: model._meta.verbose_name_plural.lower()
+    for model in (Favorite, ShoppingCartItem)
+}
+
+
+def shopping_list_lines(user):
+    # Список отдаётся построчно, по мере чтения из базы.
+    yield (
+        f'Список покупок для: {user.get_full_name() or user.username}\n'
+        f'Дата: {date_format(now().date())}\n'
+        '\n'
+        'Ингредиенты:\n'
+    )
+    recipes = Recipe.objects.filter(
+        shoppingcartitems__user=user
+    ).only('name')
+    ingredients = (
+        RecipeIngredient.objects.filter(recipe__in=recipes)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total_amount=models.Sum('amount'))
+        .order_by('ingredient__name')
+    )
+    for item in ingredients.iterator(chunk_size=500):
+        yield (
+            f'- {item["ingredient__name"]} — {item["total_amount"]} '
+            f'{item["ingredient__measurement_unit"]}\n'
+        )
+    yield '\nРецепты:\n'
+    for recipe in recipes.iterator(chunk_size=500):
+        yield f'- {recipe.name}\n'
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
@@ -57,14 +86,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly)
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-
         user = self.request.user
-        is_in_cart = self.request.query_params.get('is_in_shopping_cart')
-        if is_in_cart and user.is_authenticated:
-            queryset = queryset.filter(shoppingcartitems__user=user)
+        if user.is_authenticated:
+            queryset = Recipe.objects.annotate(
+                is_favorited=models.Exists(Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk'))),
+                is_in_shopping_cart=models.Exists(
+                    ShoppingCartItem.objects.filter(
+                        user=user, recipe=models.OuterRef('pk'))),
+            )
+        else:
+            queryset = Recipe.objects.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return queryset.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredients_in_recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('pk'),
+            ),
+        )
 
-        return queryset
+    def filter_queryset(self, queryset):
+        if not (
+            self.request.query_params.keys() & RecipeFilter.base_filters.keys()
+        ):
+            return queryset
+        return super().filter_queryset(queryset)
 
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
@@ -98,51 +149,37 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if not image:
             raise ValidationError({'image': ['Это поле обязательно.']})
 
-        old_image_path = recipe.image.path if recipe.image else None
-
         recipe.image = (
             RecipeReadSerializer().fields['image'].to_internal_value(image)
         )
-        recipe.save()
-
-        if old_image_path and os.path.isfile(old_image_path):
-            if old_image_path != recipe.image.path:
-                try:
-                    os.remove(old_image_path)
-                except Exception:
-                    pass
+        recipe.save(update_fields=['image'])
 
         return Response(
             {'image': recipe.image.url if recipe.image else None},
             status=status.HTTP_200_OK
         )
 
+    def reload_saved_recipe(self, serializer):
+        # Ответ строится по аннотированному queryset, как и при чтении.
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        self.reload_saved_recipe(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.reload_saved_recipe(serializer)
 
     @action(detail=False, methods=('get',),
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        user = request.user
-        recipes = Recipe.objects.filter(shoppingcartitems__user=user)
-
-        content = render_to_string(
-            'shopping_list.txt',
-            {
-                'user': user,
-                'date': now().date(),
-                'ingredients': (
-                    RecipeIngredient.objects.filter(recipe__in=recipes)
-                    .values('ingredient__name', 'ingredient__measurement_unit')
-                    .annotate(total_amount=models.Sum('amount'))
-                    .order_by('ingredient__name')
-                ),
-                'recipes': recipes,
-            },
+        response = StreamingHttpResponse(
+            shopping_list_lines(request.user),
+            content_type='text/plain; charset=utf-8',
         )
-
-        response = HttpResponse(content,
-                                content_type='text/plain; charset=utf-8')
         response['Content-Disposition'] = (
             'attachment; filename="shopping_list.txt"')
         return response
@@ -155,16 +192,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
 
         if request.method == 'DELETE':
-            get_object_or_404(model, user=request.user, recipe=recipe).delete()
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe=recipe
+            ).delete()
+            if not deleted:
+                raise NotFound(
+                    f'No {model._meta.object_name} matches the given query.'
+                )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-        obj, created = model.objects.get_or_create(
-            user=request.user, recipe=recipe
-        )
-        if not created:
-            collection_name = model._meta.verbose_name_plural.lower()
+        # Дубликат отсекает уникальное ограничение (user, recipe),
+        # без предварительного SELECT.
+        try:
+            with transaction.atomic():
+                model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             raise ValidationError(
-                f'Рецепт с id={recipe.id} уже добавлен в {collection_name}.'
+                f'Рецепт с id={recipe.id} уже добавлен '
+                f'в {COLLECTION_NAMES[model]}.'
             )
 
         return Response(
@@ -175,7 +220,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk=None):
-        recipe = self.get_object()
+        recipe = get_object_or_404(
+            Recipe.objects.only(*ShortRecipeSerializer.Meta.fields), pk=pk
+        )
         return self.handle_add_or_remove(
             model=ShoppingCartItem, request=request, recipe=recipe
         )
@@ -183,7 +230,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
-        recipe = self.get_object()
+        recipe = get_object_or_404(
+            Recipe.objects.only(*ShortRecipeSerializer.Meta.fields), pk=pk
+        )
         return self.handle_add_or_remove(
             model=Favorite, recipe=recipe, request=request
         )
@@ -209,26 +258,33 @@ class UserWithSubscriptionViewSet(UserViewSet):
                 .fields['avatar']
                 .to_internal_value(avatar)
             )
-            user.save()
+            user.save(update_fields=['avatar'])
 
             return Response(
                 {'avatar': user.avatar.url if user.avatar else None},
                 status=status.HTTP_200_OK
             )
 
-        old_path = user.avatar.path if (
-            user.avatar and getattr(user.avatar, 'path', None)
-        ) else None
-        if old_path and os.path.isfile(old_path):
-            try:
-                os.remove(old_path)
-            except Exception:
-                pass
-
         user.avatar = None
-        user.save()
+        user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_authors_queryset(self):
+        # Свежие рецепты первыми: без порядка срез берёт произвольные.
+        recipes = Recipe.objects.only(
+            'author', *ShortRecipeSerializer.Meta.fields
+        ).order_by('-id')
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdecimal():
+            recipes = recipes[:int(recipes_limit)]
+        return User.objects.annotate(
+            recipes_count=models.Count('recipes')
+        ).prefetch_related(
+            models.Prefetch(
+                'recipes', queryset=recipes, to_attr='limited_recipes'
+            )
+        ).order_by('username')
+
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
@@ -236,21 +292,21 @@ class UserWithSubscriptionViewSet(UserViewSet):
         user = request.user
 
         if request.method == 'DELETE':
-            get_object_or_404(
-                Follow, follower=request.user, author_id=pk
+            deleted, _ = Follow.objects.filter(
+                follower=request.user, author_id=pk
             ).delete()
+            if not deleted:
+                raise NotFound('No Follow matches the given query.')
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-        author = get_object_or_404(User, pk=pk)
+        author = get_object_or_404(self.get_authors_queryset(), pk=pk)
 
         if user == author:
             raise ValidationError('Нельзя подписаться на самого себя')
 
-        serializer = FollowCreateSerializer(
-            data={'follower': user.id, 'author': author.id}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        _, created = Follow.objects.get_or_create(follower=user, author=author)
+        if not created:
+            raise ValidationError('Подписка уже существует')
 
         out = FollowedUserSerializer(author, context={'request': request})
         return Response(out.data, status=status.HTTP_201_CREATED)
@@ -261,10 +317,8 @@ class UserWithSubscriptionViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        authors = User.objects.filter(
-            pk__in=Follow.objects.filter(
-                follower=request.user
-            ).values_list('author__id', flat=True)
+        authors = self.get_authors_queryset().filter(
+            author_followes__follower=request.user
         )
         paginator = RecipePagination()
         return paginator.get_paginated_response(
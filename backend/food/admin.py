@@ -227,6 +227,7 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ('name', 'author__username')
     list_filter = ('author', CookingTimeFilter, 'tags')
+    list_select_related = ('author',)
     inlines = (RecipeIngredientInline,)
 
     def get_queryset(self, request):
@@ -234,6 +235,8 @@ class RecipeAdmin(admin.ModelAdmin):
         return qs.annotate(
             _favorites_count=Count(
                 'favorites', distinct=True)
+        ).prefetch_related(
+            'tags', 'ingredients_in_recipe__ingredient'
         )
 
     @admin.display(description='В избранном')
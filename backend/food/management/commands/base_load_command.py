@@ -1,6 +1,10 @@
-import json
+from itertools import islice
 
+import ijson
 from django.core.management.base import BaseCommand
+from django.db import transaction
+
+BATCH_SIZE = 1000
 
 
 class BaseLoadCommand(BaseCommand):
@@ -18,21 +22,27 @@ class BaseLoadCommand(BaseCommand):
 
     def handle(self, *args, **options):
         file_path = options['file_path']
+        count = 0
 
+        # Файл читается потоково и сохраняется пачками, поэтому
+        # в памяти одновременно находится не больше BATCH_SIZE объектов.
         try:
-            with open(file_path, encoding='utf-8') as file:
-                data = json.load(file)
+            with open(file_path, 'rb') as file, transaction.atomic():
+                items = ijson.items(file, 'item')
+                while batch := [
+                    self.model(**item) for item in islice(items, BATCH_SIZE)
+                ]:
+                    count += len(self.model.objects.bulk_create(
+                        batch,
+                        ignore_conflicts=True,
+                        batch_size=BATCH_SIZE,
+                    ))
         except Exception as err:
             self.stderr.write(self.style.ERROR(
                 f'Ошибка при обработке файла {file_path}: {err}'
             ))
             return
 
-        created = self.model.objects.bulk_create(
-            (self.model(**item) for item in data),
-            ignore_conflicts=True
-        )
-        count = len(created)
         self.stdout.write(
             self.style.SUCCESS(
                 f'Добавлено {count} объектов из файла "{file_path}"'
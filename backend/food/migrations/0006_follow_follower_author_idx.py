@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-15 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0005_alter_recipe_options_alter_recipeingredient_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'author'], name='follow_follower_author_idx'),
+        ),
+    ]
@@ -72,6 +72,13 @@ class Follow(models.Model):
                 name='unique_author_follower'
             )
         ]
+        indexes = [
+            # подписки пользователя выбираются по подписчику
+            models.Index(
+                fields=('follower', 'author'),
+                name='follow_follower_author_idx'
+            )
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
@@ -1,17 +1,127 @@
-import base64
-import uuid
+import io
+import re
+import secrets
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
 from rest_framework import serializers
 
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+DECODE_CHUNK_SIZE = 64 * 1024
+DATA_URL = re.compile(r'data:(image/[\w.+-]+);base64,')
+BASE64_HEAD = re.compile(r'[A-Za-z0-9+/=\s]*')
+WHITESPACE = re.compile(r'\s+')
+BASE64_HEAD_LENGTH = 64
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def get_image_extension(head):
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class Base64UploadedFile(TemporaryUploadedFile):
+
+    def __del__(self):
+        # Хранилище перемещает временный файл, а close() Django
+        # корректно обрабатывает его отсутствие.
+        self.close()
+
 
 class Base64ImageField(serializers.ImageField):
 
+    def decode(self, chunk):
+        try:
+            return base64.b64decode(chunk.encode('ascii'), validate=False)
+        except ValueError:
+            self.fail('invalid_image')
+
+    def decode_chunks(self, data, start):
+        # Переносы строк (base64 в стиле MIME) сдвигают выравнивание
+        # по 4 символа: убираем пробельные символы, а неполную четвёрку
+        # переносим в следующий кусок.
+        tail = ''
+        for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+            chunk = tail + WHITESPACE.sub(
+                '', data[offset:offset + DECODE_CHUNK_SIZE]
+            )
+            cut = len(chunk) - len(chunk) % 4
+            tail = chunk[cut:]
+            yield self.decode(chunk[:cut])
+        if tail:
+            yield self.decode(tail)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            uid = uuid.uuid4()
-            filename = f'{uid}.{ext}'
-            data = ContentFile(base64.b64decode(imgstr), name=filename)
+            match = DATA_URL.match(data)
+            if match is None:
+                self.fail('invalid_image')
+            mime = match[1]
+            start = match.end()
+            if not BASE64_HEAD.fullmatch(
+                data, start, start + BASE64_HEAD_LENGTH
+            ):
+                self.fail('invalid_image')
+
+            # Расширение определяем по сигнатуре содержимого,
+            # а не по заголовку, присланному клиентом.
+            chunks = self.decode_chunks(data, start)
+            head = next(chunks, b'')
+            if not head:
+                self.fail('empty')
+            ext = get_image_extension(head)
+            if ext is None:
+                self.fail('invalid_image')
+            filename = f'{secrets.token_hex(16)}.{ext}'
+
+            # Как и обработчики загрузки Django: небольшие файлы
+            # остаются в памяти, крупные пишутся во временный файл.
+            if (
+                (len(data) - start) * 3 // 4
+                > settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            ):
+                upload = Base64UploadedFile(filename, mime, 0, None)
+            else:
+                upload = InMemoryUploadedFile(
+                    io.BytesIO(), None, filename, mime, 0, None
+                )
+            upload.write(head)
+            try:
+                for chunk in chunks:
+                    upload.write(chunk)
+            except serializers.ValidationError:
+                upload.close()
+                raise
+            upload.size = upload.tell()
+            upload.seek(0)
+            try:
+                return super().to_internal_value(upload)
+            except (ValidationError, serializers.ValidationError):
+                upload.close()
+                raise
         return super().to_internal_value(data)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        # Один и тот же файл (например, аватар автора) встречается
+        # в ответе многократно: строим URL через хранилище один раз.
+        urls = self.context.setdefault('image_urls', {})
+        if value.name not in urls:
+            urls[value.name] = super().to_representation(value)
+        return urls[value.name]